@@ -1,20 +1,60 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, abort
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, select, delete, bindparam, lambda_stmt, text, Index, event
+from sqlalchemy.engine import Engine
 from flask_login import UserMixin, LoginManager, login_user, logout_user, login_required, current_user
+from flask_caching import Cache
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from collections import defaultdict
-import pandas as pd
-import io
-import base64
+from concurrent.futures import ThreadPoolExecutor
+import cachetools.func
+import logging
 import os
-import matplotlib.pyplot as plt
-import json  # Import the json module
+
+logger = logging.getLogger(__name__)
+
+def _read_or_create_secret_key(path):
+    """Load the session key from disk, generating it on first run.
+
+    Every worker must share the same key, otherwise sessions signed by one
+    gunicorn worker are rejected by the next and users are logged out.
+    """
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    key = os.urandom(32)
+    with open(path, 'wb') as f:
+        f.write(key)
+    return key
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SECRET_KEY'] = os.urandom(24)  # Generate a strong secret key
+# Keep connections warm instead of reconnecting per request. Sized for a
+# single worker; with gunicorn, keep workers * (pool_size + max_overflow)
+# under the OS file-descriptor limit.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 25,
+    'max_overflow': 25,
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+    'connect_args': {'check_same_thread': False},
+}
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or _read_or_create_secret_key('.secret_key')
+app.config['CACHE_TYPE'] = 'SimpleCache'  # Use Redis instead when running multiple workers
 db = SQLAlchemy(app)
+cache = Cache(app)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer holds the lock, and the busy
+    # timeout makes concurrent writers wait instead of failing immediately.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -36,59 +76,93 @@ class Expense(db.Model):
     date = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        Index('ix_expense_user_date', 'user_id', 'date'),
+        # Covers the category group-by/sum and the distinct-category query
+        # without touching the table.
+        Index('ix_expense_user_cat_amt', 'user_id', 'category', 'amount'),
+    )
+
     def __repr__(self):
         return f'<Expense {self.id}>'
 
 with app.app_context():
     db.create_all()
+    # create_all does not touch existing tables, so add the indexes to
+    # databases created before they were declared on the model.
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_expense_user_date ON expense (user_id, date)'))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_expense_user_cat_amt ON expense (user_id, category, amount)'))
+    db.session.execute(text('DROP INDEX IF EXISTS ix_expense_user_cat'))
+    db.session.commit()
+
+# pbkdf2_hmac releases the GIL inside OpenSSL, so hashing in a pool lets the
+# worker keep serving other requests during the ~100 ms of key stretching.
+_hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def hash_password(password):
+    return _hash_executor.submit(generate_password_hash, password).result()
+
+def verify_password(stored_hash, password):
+    return _hash_executor.submit(check_password_hash, stored_hash, password).result()
+
+@cachetools.func.ttl_cache(maxsize=1024, ttl=60)
+def _load_user_cached(uid):
+    # lambda_stmt caches the constructed/compiled statement across requests,
+    # so these per-request lookups skip expression building entirely.
+    stmt = lambda_stmt(lambda: select(User).where(User.id == bindparam('uid')))
+    user = db.session.execute(stmt, {'uid': uid}).scalar_one_or_none()
+    if user is not None:
+        # Detach before caching so later commits in the loading request
+        # cannot expire the instance's state.
+        db.session.expunge(user)
+    return user
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-def generate_category_bar_chart(expenses):
-    category_totals = defaultdict(float)
-    for expense in expenses:
-        category_totals[expense.category] += expense.amount
-    if not category_totals:
+    # Flask-Login calls this on every authenticated request; the TTL cache
+    # saves the user SELECT for 60 s. Call _load_user_cached.cache_clear()
+    # if a user's credentials change.
+    user = _load_user_cached(int(user_id))
+    if user is None:
         return None
-    categories = list(category_totals.keys())
-    totals = list(category_totals.values())
-    plt.figure(figsize=(10, 6))
-    plt.bar(categories, totals, color='skyblue')
-    plt.xlabel('Category')
-    plt.ylabel('Total Amount')
-    plt.title('Expenses by Category')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plot_url = base64.b64encode(img.getvalue()).decode()
-    plt.close()
-    return f'data:image/png;base64,{plot_url}'
-
-def generate_time_series_plot_matplotlib(expenses):
-    if not expenses:
-        return None
-    df = pd.DataFrame([(exp.date, exp.amount) for exp in expenses], columns=['date', 'amount'])
-    df['month'] = pd.to_datetime(df['date']).dt.to_period('M')
-    monthly_totals = df.groupby('month')['amount'].sum().sort_index()
-    if monthly_totals.empty:
-        return None
-    plt.figure(figsize=(10, 6))
-    plt.plot(monthly_totals.index.astype(str), monthly_totals.values, marker='o', linestyle='-')
-    plt.xlabel('Month')
-    plt.ylabel('Total Amount')
-    plt.title('Monthly Expenses Over Time')
-    plt.grid(True)
-    plt.tight_layout()
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plot_url = base64.b64encode(img.getvalue()).decode()
-    plt.close()
-    return f'data:image/png;base64,{plot_url}'
+    return db.session.merge(user, load=False)
+
+def get_user_expense_or_404(id, user_id):
+    stmt = lambda_stmt(lambda: select(Expense).where(
+        Expense.id == bindparam('id'), Expense.user_id == bindparam('uid')))
+    expense = db.session.execute(stmt, {'id': id, 'uid': user_id}).scalar_one_or_none()
+    if expense is None:
+        abort(404)
+    return expense
+
+def bulk_add_expenses(rows):
+    """Insert many expense dicts in one transaction so fsync cost is paid once."""
+    db.session.bulk_insert_mappings(Expense, rows)
+    db.session.commit()
+    for user_id in {row['user_id'] for row in rows}:
+        cache.delete_memoized(_compute_summary, user_id)
+
+def category_totals_sql(user_id):
+    """Sum expense amounts per category in SQL, returning {category: total}."""
+    rows = db.session.query(Expense.category, func.sum(Expense.amount)) \
+        .filter_by(user_id=user_id) \
+        .group_by(Expense.category).all()
+    return {category: total for category, total in rows}
+
+def monthly_totals_sql(user_id):
+    """Sum expense amounts per calendar month in SQL, returning {'YYYY-MM': total} in order."""
+    month = func.strftime('%Y-%m', Expense.date)
+    rows = db.session.query(month, func.sum(Expense.amount)) \
+        .filter(Expense.user_id == user_id) \
+        .group_by(month).order_by(month).all()
+    return {month: total for month, total in rows}
+
+@cache.memoize(timeout=300)
+def _compute_summary(user_id):
+    """Cached summary aggregates; invalidated whenever the user's expenses change."""
+    return category_totals_sql(user_id), monthly_totals_sql(user_id)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -99,7 +173,7 @@ def register():
         if user:
             flash('Username already exists. Please choose another one.')
             return redirect(url_for('register'))
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         new_user = User(username=username, password=hashed_password)
         db.session.add(new_user)
         db.session.commit()
@@ -113,7 +187,7 @@ def login():
         username = request.form['username']
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
+        if user and verify_password(user.password, password):
             login_user(user)
             return redirect(url_for('index'))
         else:
@@ -139,21 +213,32 @@ def add_expense():
         description = request.form['description']
         amount = float(request.form['amount'])
         category = request.form['category']
-        new_expense = Expense(description=description, amount=amount, category=category, user_id=current_user.id)
-        db.session.add(new_expense)
-        db.session.commit()
+        bulk_add_expenses([{'description': description, 'amount': amount,
+                            'category': category, 'user_id': current_user.id}])
         return redirect(url_for('view_expenses'))
     return render_template('add_expense.html')
 
+@app.route('/add_expenses_bulk', methods=['POST'])
+@login_required
+def add_expenses_bulk():
+    rows = [{'description': item['description'],
+             'amount': float(item['amount']),
+             'category': item['category'],
+             'user_id': current_user.id}
+            for item in request.get_json(force=True)]
+    bulk_add_expenses(rows)
+    return {'inserted': len(rows)}, 201
+
 @app.route('/edit_expense/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_expense(id):
-    expense_to_edit = Expense.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    expense_to_edit = get_user_expense_or_404(id, current_user.id)
     if request.method == 'POST':
         expense_to_edit.description = request.form['description']
         expense_to_edit.amount = float(request.form['amount'])
         expense_to_edit.category = request.form['category']
         db.session.commit()
+        cache.delete_memoized(_compute_summary, current_user.id)
         flash('Expense updated successfully!', 'success')
         return redirect(url_for('view_expenses'))
     return render_template('edit_expense.html', expense=expense_to_edit)
@@ -161,72 +246,53 @@ def edit_expense(id):
 @app.route('/view_expenses', methods=['GET', 'POST'])
 @login_required
 def view_expenses():
-    category_filter = request.form.get('category_filter')
+    # request.values covers both the POST from the filter form and the GET
+    # query arg carried by pagination links.
+    category_filter = request.values.get('category_filter')
     expenses_query = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date.desc())
 
     if category_filter and category_filter != 'all':
         expenses_query = expenses_query.filter_by(category=category_filter)
 
-    expenses = expenses_query.all()
-    all_categories = [expense.category for expense in Expense.query.filter_by(user_id=current_user.id).distinct().all()]
-    all_categories = sorted(list(set(all_categories)))
+    page = request.args.get('page', 1, type=int)
+    pagination = expenses_query.paginate(page=page, per_page=50, error_out=False)
+
+    # A single page no longer covers every category, so the dropdown always
+    # needs the distinct query.
+    result = db.session.execute(
+        select(Expense.category).where(Expense.user_id == current_user.id)
+        .distinct().order_by(Expense.category))
+    all_categories = result.scalars().all()
     all_categories.insert(0, 'all') # Add 'all' option for no filter
 
-    return render_template('view_expenses.html', expenses=expenses, all_categories=all_categories, current_filter=category_filter)
+    return render_template('view_expenses.html', expenses=pagination.items,
+                           pagination=pagination, all_categories=all_categories,
+                           current_filter=category_filter)
 
 @app.route('/delete_expense/<int:id>')
 @login_required
 def delete_expense(id):
-    expense_to_delete = Expense.query.filter_by(id=id, user_id=current_user.id).first_or_404()
-    db.session.delete(expense_to_delete)
+    result = db.session.execute(
+        delete(Expense).where(Expense.id == id, Expense.user_id == current_user.id))
+    if result.rowcount == 0:
+        abort(404)
     db.session.commit()
+    cache.delete_memoized(_compute_summary, current_user.id)
     flash('Expense deleted successfully!', 'success')
     return redirect(url_for('view_expenses'))
 
 @app.route('/summary')
 @login_required
 def show_summary():
-    expenses = Expense.query.filter_by(user_id=current_user.id).all()
-
-    # Pie Chart
-    category_totals_pie = defaultdict(float)
-    for expense in expenses:
-        category_totals_pie[expense.category] += expense.amount
-    pie_plot_url = None
-    print("category_totals_pie:", category_totals_pie) # Debugging
-    if category_totals_pie:
-        labels = list(category_totals_pie.keys())
-        sizes = list(category_totals_pie.values())
-        print("Pie Chart Labels:", labels) # Debugging
-        print("Pie Chart Sizes:", sizes) # Debugging
-        plt.figure(figsize=(8, 8))
-        plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=140)
-        plt.title('Expenses by Category')
-        plt.axis('equal')
-        img = io.BytesIO()
-        plt.savefig(img, format='png')
-        img.seek(0)
-        plot_url = base64.b64encode(img.getvalue()).decode()
-        pie_plot_url = f'data:image/png;base64,{plot_url}'
-        print("Generated pie_plot_url (first 50 chars):", pie_plot_url[:50]) # Debugging
-        plt.close()
-    else:
-        print("No category data for pie chart.") # Debugging
-
-    # Bar Chart
-    bar_plot_url = generate_category_bar_chart(expenses)
-
-    # Time Series Plot
-    time_series_plot_url = generate_time_series_plot_matplotlib(expenses)
+    category_totals, monthly_totals = _compute_summary(current_user.id)
+    logger.debug("category_totals=%r", category_totals)
+    logger.debug("monthly_totals=%r", monthly_totals)
 
     return render_template(
         'summary.html',
-        pie_plot_url=pie_plot_url,
-        bar_plot_url=bar_plot_url,
-        time_series_plot_url=time_series_plot_url,
-        has_expenses=bool(expenses),
-        category_totals_pie_json=json.dumps(category_totals_pie),
-        monthly_totals_json=json.dumps(dict(sorted(defaultdict(float).items()))) # Initialize empty for now
+        has_expenses=bool(category_totals),
+        category_totals=category_totals,
+        monthly_totals=monthly_totals
     )
 
 if __name__ == '__main__':